@@ -65,6 +65,10 @@ _header_size = struct.calcsize(_header_format)
 _magic_number_bytes = _magic_number.to_bytes(2, "big")
 _protocol_version_bytes = PROTOCOL_VERSION.to_bytes(2, "big")
 _empty_correlation_id = b"\0" * 16
+# payloads smaller than this aren't worth compressing; the zlib overhead outweighs the savings
+_compression_threshold = 200
+# zlib level 1 is a lot faster than the default and only slightly worse in ratio on typical payloads
+_compression_level = 1
 
 
 class SendingMessage:
@@ -77,9 +81,12 @@ class SendingMessage:
         annotations = annotations or {}
         annotations_size = sum([8 + len(v) for v in annotations.values()])
         flags &= ~FLAGS_COMPRESSED
-        if config.COMPRESSION and len(payload) > 100:
-            payload = zlib.compress(payload, 4)
-            flags |= FLAGS_COMPRESSED
+        if config.COMPRESSION and len(payload) > _compression_threshold:
+            compressed = zlib.compress(payload, _compression_level)
+            if len(compressed) < len(payload):
+                # only send compressed data if it actually saves bytes
+                payload = compressed
+                flags |= FLAGS_COMPRESSED
         self.flags = flags
         total_size = len(payload) + annotations_size
         if total_size > config.MAX_MESSAGE_SIZE:
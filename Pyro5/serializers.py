@@ -6,6 +6,8 @@ Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
 
 import array
 import builtins
+import math
+import sys
 import uuid
 import logging
 import struct
@@ -15,27 +17,137 @@ import numbers
 import inspect
 import marshal
 import json
+import re
 import serpent
 import contextlib
+import threading
+import enum
+import dataclasses
+import functools
 try:
     import msgpack
 except ImportError:
     msgpack = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from . import errors
 
 __all__ = ["SerializerBase", "SerpentSerializer", "JsonSerializer", "MarshalSerializer", "MsgpackSerializer",
-           "serializers", "serializers_by_id"]
+           "MsgspecSerializer", "serializers", "serializers_by_id"]
 
 log = logging.getLogger("Pyro5.serializers")
 
 
-all_exceptions = {}
-for name, t in vars(builtins).items():
-    if type(t) is type and issubclass(t, BaseException):
-        all_exceptions[name] = t
-for name, t in vars(errors).items():
+@functools.lru_cache(maxsize=256)
+def _resolve_exception(name):
+    """Returns the Pyro error or builtin exception class with the given (unqualified) name, or None."""
+    t = getattr(errors, name, None)
     if type(t) is type and issubclass(t, errors.PyroError):
-        all_exceptions[name] = t
+        return t
+    t = getattr(builtins, name, None)
+    if type(t) is type and issubclass(t, BaseException):
+        return t
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _uuid_str(uuid_obj):
+    """Cached str() of uuids, because the same uuids tend to be sent over and over again"""
+    return str(uuid_obj)
+
+
+_orjson_key_types = {str, int, bool, type(None)}
+
+
+def _orjson_compatible(data):
+    """
+    Checks if orjson encodes the (possibly nested) data exactly like the json module does.
+    It doesn't for NaN and Infinity (null), enums, subclasses of the builtin types, non-str dict keys
+    other than int, bool and None, and integers that don't fit in 64 bits (error).
+    Other objects are left alone: orjson passes them to the default hook, which checks what they're converted into.
+    """
+    stack = [data]
+    seen = set()    # containers that were already checked, this also stops on circular references
+    while stack:
+        obj = stack.pop()
+        t = type(obj)
+        if t is str or t is bool or obj is None:
+            continue
+        if t is int:
+            if not -0x8000000000000000 <= obj <= 0xffffffffffffffff:
+                return False
+        elif t is float:
+            if not math.isfinite(obj):
+                return False
+        elif t is dict or t is list or t is tuple:
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if t is dict:
+                if not _orjson_key_types.issuperset(map(type, obj)):
+                    return False
+                stack.extend(obj.values())
+            else:
+                stack.extend(obj)
+        elif isinstance(obj, (str, int, float, dict, list, tuple, enum.Enum)):
+            return False
+    return True
+
+
+def _has_class_marker(literal):
+    """Checks if there's any dict with a __class__ key in the (possibly nested) data."""
+    stack = [literal]
+    while stack:
+        obj = stack.pop()
+        t = type(obj)
+        if t is dict:
+            if "__class__" in obj:
+                return True
+            stack.extend(obj.values())
+        elif t is list or t is tuple or t is set:
+            stack.extend(obj)
+    return False
+
+
+_dict_to_class_constructors = {}
+_bytes_classnames = {}      # encoded classname -> interned str, to avoid decoding the common classnames
+
+
+def _init_dict_to_class_constructors():
+    """Fills the lookup table of the constructors of Pyro's own classes, used by dict_to_class."""
+    from . import core, client, server  # circular imports...
+
+    def from_state(clazz):
+        def constructor(data):
+            obj = clazz.__new__(clazz)
+            obj.__setstate__(data["state"])
+            return obj
+        return constructor
+
+    def exception_wrapper(data):
+        ex = data["exception"]
+        if isinstance(ex, dict) and "__class__" in ex:
+            ex = SerializerBase.dict_to_class(ex)
+        return core._ExceptionWrapper(ex)
+
+    _dict_to_class_constructors.update({
+        "Pyro5.core.URI": from_state(core.URI),
+        "Pyro5.client.Proxy": from_state(client.Proxy),
+        "Pyro5.server.Daemon": from_state(server.Daemon),
+        "Pyro5.util.SerpentSerializer": lambda data: SerpentSerializer(),
+        "Pyro5.util.MarshalSerializer": lambda data: MarshalSerializer(),
+        "Pyro5.util.JsonSerializer": lambda data: JsonSerializer(),
+        "Pyro5.util.MsgpackSerializer": lambda data: MsgpackSerializer(),
+        "struct.error": lambda data: SerializerBase.make_exception(struct.error, data),
+        "Pyro5.core._ExceptionWrapper": exception_wrapper
+    })
+    _bytes_classnames.update({classname.encode("utf-8"): sys.intern(classname) for classname in _dict_to_class_constructors})
 
 
 def pyro_class_serpent_serializer(obj, serializer, stream, level):
@@ -57,6 +169,7 @@ class SerializerBase(object):
     """Base class for (de)serializer implementations (which must be thread safe)"""
     serializer_id = 0  # define uniquely in subclass
     __custom_class_to_dict_registry = {}
+    __custom_class_to_dict_items = ()      # snapshot of the registry's items, for fast iteration
     __custom_dict_to_class_registry = {}
 
     def loads(self, data):
@@ -75,18 +188,12 @@ class SerializerBase(object):
     def register_type_replacement(cls, object_type, replacement_function):
         raise NotImplementedError("implement in subclass")
 
-    def _convertToBytes(self, data):
-        if type(data) is bytearray:
-            return bytes(data)
-        if type(data) is memoryview:
-            return data.tobytes()
-        return data
-
     @classmethod
     def register_class_to_dict(cls, clazz, converter, serpent_too=True):
         """Registers a custom function that returns a dict representation of objects of the given class.
         The function is called with a single parameter; the object to be converted to a dict."""
         cls.__custom_class_to_dict_registry[clazz] = converter
+        SerializerBase.__custom_class_to_dict_items = tuple(cls.__custom_class_to_dict_registry.items())
         if serpent_too:
             with contextlib.suppress(errors.ProtocolError):
                 def serpent_converter(obj, serializer, stream, level):
@@ -101,6 +208,7 @@ class SerializerBase(object):
         will be serialized by the default mechanism again."""
         if clazz in cls.__custom_class_to_dict_registry:
             del cls.__custom_class_to_dict_registry[clazz]
+            SerializerBase.__custom_class_to_dict_items = tuple(cls.__custom_class_to_dict_registry.items())
         with contextlib.suppress(errors.ProtocolError):
             serpent.unregister_class(clazz)
 
@@ -126,9 +234,9 @@ class SerializerBase(object):
         """
         Convert a non-serializable object to a dict. Partly borrowed from serpent.
         """
-        for clazz in cls.__custom_class_to_dict_registry:
+        for clazz, converter in cls.__custom_class_to_dict_items:
             if isinstance(obj, clazz):
-                return cls.__custom_class_to_dict_registry[clazz](obj)
+                return converter(obj)
         if type(obj) in (set, dict, tuple, list):
             # we use a ValueError to mirror the exception type returned by serpent and other serializers
             raise ValueError("can't serialize type " + str(obj.__class__) + " into a dict")
@@ -150,10 +258,10 @@ class SerializerBase(object):
             if isinstance(value, dict):
                 return value
         try:
-            value = dict(vars(obj))  # make sure we can serialize anything that resembles a dict
+            value = obj.__dict__.copy()  # make sure we can serialize anything that resembles a dict
             value["__class__"] = obj.__class__.__module__ + "." + obj.__class__.__name__
             return value
-        except TypeError:
+        except AttributeError:
             if hasattr(obj, "__slots__"):
                 # use the __slots__ instead of the vars dict
                 value = {}
@@ -172,52 +280,29 @@ class SerializerBase(object):
         Recreate an object out of a dict containing the class name and the attributes.
         Only a fixed set of classes are recognized.
         """
-        from . import core, client, server  # circular imports...
+        if not _dict_to_class_constructors:
+            _init_dict_to_class_constructors()
         classname = data.get("__class__", "<unknown>")
         if isinstance(classname, bytes):
-            classname = classname.decode("utf-8")
+            classname = _bytes_classnames.get(classname) or classname.decode("utf-8")
         if classname in cls.__custom_dict_to_class_registry:
             converter = cls.__custom_dict_to_class_registry[classname]
             return converter(classname, data)
         if "__" in classname:
             raise errors.SecurityError("refused to deserialize types with double underscores in their name: " + classname)
-        # for performance reasons, the constructors below are hardcoded here
+        # for performance reasons, the constructors for Pyro's own classes are in a fixed lookup table
         # instead of added on a per-class basis to the dict-to-class registry
-        if classname == "Pyro5.core.URI":
-            uri = core.URI.__new__(core.URI)
-            uri.__setstate__(data["state"])
-            return uri
-        elif classname == "Pyro5.client.Proxy":
-            proxy = client.Proxy.__new__(client.Proxy)
-            proxy.__setstate__(data["state"])
-            return proxy
-        elif classname == "Pyro5.server.Daemon":
-            daemon = server.Daemon.__new__(server.Daemon)
-            daemon.__setstate__(data["state"])
-            return daemon
-        elif classname.startswith("Pyro5.util."):
-            if classname == "Pyro5.util.SerpentSerializer":
-                return SerpentSerializer()
-            elif classname == "Pyro5.util.MarshalSerializer":
-                return MarshalSerializer()
-            elif classname == "Pyro5.util.JsonSerializer":
-                return JsonSerializer()
-            elif classname == "Pyro5.util.MsgpackSerializer":
-                return MsgpackSerializer()
-        elif classname.startswith("Pyro5.errors."):
+        constructor = _dict_to_class_constructors.get(classname)
+        if constructor:
+            return constructor(data)
+        if classname.startswith("Pyro5.errors."):
             errortype = getattr(errors, classname.split('.', 2)[2])
             if issubclass(errortype, errors.PyroError):
                 return SerializerBase.make_exception(errortype, data)
-        elif classname == "struct.error":
-            return SerializerBase.make_exception(struct.error, data)
-        elif classname == "Pyro5.core._ExceptionWrapper":
-            ex = data["exception"]
-            if isinstance(ex, dict) and "__class__" in ex:
-                ex = SerializerBase.dict_to_class(ex)
-            return core._ExceptionWrapper(ex)
         elif data.get("__exception__", False):
-            if classname in all_exceptions:
-                return SerializerBase.make_exception(all_exceptions[classname], data)
+            exceptiontype = _resolve_exception(classname)
+            if exceptiontype:
+                return SerializerBase.make_exception(exceptiontype, data)
             # translate to the appropriate namespace...
             namespace, short_classname = classname.split('.', 1)
             if namespace in ("builtins", "exceptions"):
@@ -236,27 +321,46 @@ class SerializerBase(object):
     def make_exception(exceptiontype, data):
         ex = exceptiontype(*data["args"])
         if "attributes" in data:
-            # restore custom attributes on the exception object
-            for attr, value in data["attributes"].items():
-                setattr(ex, attr, value)
+            # restore custom attributes on the exception object (they came from its vars())
+            try:
+                ex.__dict__.update(data["attributes"])
+            except AttributeError:
+                for attr, value in data["attributes"].items():
+                    setattr(ex, attr, value)
         return ex
 
     def recreate_classes(self, literal):
-        t = type(literal)
-        if t is set:
-            return {self.recreate_classes(x) for x in literal}
-        if t is list:
-            return [self.recreate_classes(x) for x in literal]
-        if t is tuple:
-            return tuple(self.recreate_classes(x) for x in literal)
-        if t is dict:
-            if "__class__" in literal:
-                return self.dict_to_class(literal)
-            result = {}
-            for key, value in literal.items():
-                result[key] = self.recreate_classes(value)
-            return result
-        return literal
+        if not _has_class_marker(literal):
+            return literal      # plain data, nothing to convert
+        # Iterative post-order traversal (instead of recursion) that rebuilds the containers.
+        # Every stack entry is: (container type, iterator over children, converted children, dict keys)
+        stack = [(list, iter((literal,)), [], None)]
+        while True:
+            kind, children, converted, keys = stack[-1]
+            for child in children:
+                t = type(child)
+                if t is dict:
+                    if "__class__" in child:
+                        converted.append(self.dict_to_class(child))
+                    else:
+                        stack.append((dict, iter(child.values()), [], list(child)))
+                        break
+                elif t is list or t is tuple or t is set:
+                    stack.append((t, iter(child), [], None))
+                    break
+                else:
+                    converted.append(child)
+            else:
+                stack.pop()
+                if kind is dict:
+                    value = dict(zip(keys, converted))
+                elif kind is list:
+                    value = converted
+                else:
+                    value = kind(converted)
+                if not stack:
+                    return value[0]
+                stack[-1][2].append(value)
 
     def __eq__(self, other):
         """this equality method is only to support the unit tests of this class"""
@@ -320,14 +424,12 @@ class MarshalSerializer(SerializerBase):
         return marshal.dumps(self.convert_obj_into_marshallable(data))
 
     def loadsCall(self, data):
-        data = self._convertToBytes(data)
-        obj, method, vargs, kwargs = marshal.loads(data)
+        obj, method, vargs, kwargs = marshal.loads(data)    # accepts bytearray and memoryview as well
         vargs = self.recreate_classes(vargs)
         kwargs = self.recreate_classes(kwargs)
         return obj, method, vargs, kwargs
 
     def loads(self, data):
-        data = self._convertToBytes(data)
         return self.recreate_classes(marshal.loads(data))
 
     def convert_obj_into_marshallable(self, obj):
@@ -359,39 +461,73 @@ class JsonSerializer(SerializerBase):
     serializer_id = 3  # never change this
 
     __type_replacements = {}
+    # orjson encodes uuids itself, bypassing the default hook (and so the type replacement)
+    __orjson_bypasses_replacement = False
+    # orjson would decode integers that don't fit in 64 bits as floats, leave those to the json module
+    __long_int = re.compile(rb"\d{19}")
 
     def dumpsCall(self, obj, method, vargs, kwargs):
-        data = {"object": obj, "method": method, "params": vargs, "kwargs": kwargs}
-        data = json.dumps(data, ensure_ascii=False, default=self.default)
-        return data.encode("utf-8")
+        return self.dumps({"object": obj, "method": method, "params": vargs, "kwargs": kwargs})
 
     def dumps(self, data):
+        # orjson is a lot faster and directly produces utf-8 bytes, but it is only used
+        # if it encodes the data exactly like the json module would.
+        if orjson and not self.__orjson_bypasses_replacement and _orjson_compatible(data):
+            try:
+                return orjson.dumps(data, default=self.__orjson_default, option=orjson.OPT_NON_STR_KEYS |
+                                    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+            except TypeError:
+                pass    # for instance an object that converts into something orjson encodes differently
         data = json.dumps(data, ensure_ascii=False, default=self.default)
         return data.encode("utf-8")
 
+    def __orjson_default(self, obj):
+        obj = self.default(obj)
+        if not _orjson_compatible(obj):
+            raise TypeError("leave this to the json module")
+        return obj
+
     def loadsCall(self, data):
-        data = self._convertToBytes(data).decode("utf-8")
-        data = json.loads(data)
+        data = self._loads(data)
         vargs = self.recreate_classes(data["params"])
         kwargs = self.recreate_classes(data["kwargs"])
         return data["object"], data["method"], vargs, kwargs
 
     def loads(self, data):
-        data = self._convertToBytes(data).decode("utf-8")
-        return self.recreate_classes(json.loads(data))
+        return self.recreate_classes(self._loads(data))
+
+    def _loads(self, data):
+        if orjson and not self.__long_int.search(data):
+            try:
+                return orjson.loads(data)
+            except ValueError:
+                pass    # for instance NaN or Infinity, which orjson doesn't accept
+        return json.loads(str(data, "utf-8"))    # decodes bytearray and memoryview without copying them
+
+    # converters for the most common types that json can't encode itself.
+    # datetime must come before date, because it is a subclass of it
+    __converters = {
+        set: tuple,     # json module can't deal with sets so we make a tuple out of it
+        uuid.UUID: _uuid_str,
+        datetime.datetime: datetime.datetime.isoformat,
+        datetime.date: datetime.date.isoformat,
+        decimal.Decimal: str
+    }
 
     def default(self, obj):
         replacer = self.__type_replacements.get(type(obj), None)
         if replacer:
             obj = replacer(obj)
-        if isinstance(obj, set):
-            return tuple(obj)  # json module can't deal with sets so we make a tuple out of it
-        if isinstance(obj, uuid.UUID):
-            return str(obj)
-        if isinstance(obj, (datetime.datetime, datetime.date)):
-            return obj.isoformat()
-        if isinstance(obj, decimal.Decimal):
-            return str(obj)
+        return self._convert(obj)
+
+    def _convert(self, obj):
+        converter = self.__converters.get(type(obj))
+        if converter:
+            return converter(obj)
+        # subclasses of the types above use the same converters
+        for base_type, converter in self.__converters.items():
+            if isinstance(obj, base_type):
+                return converter(obj)
         if isinstance(obj, array.array):
             if obj.typecode == 'c':
                 return obj.tostring()
@@ -405,6 +541,12 @@ class JsonSerializer(SerializerBase):
         if object_type is type or not inspect.isclass(object_type):
             raise ValueError("refusing to register replacement for a non-type or the type 'type' itself")
         cls.__type_replacements[object_type] = replacement_function
+        if object_type is uuid.UUID:
+            JsonSerializer.__orjson_bypasses_replacement = True
+
+
+# per-thread reusable msgpack Packers, by id of the serializer that uses them
+_msgpack_packers = threading.local()
 
 
 class MsgpackSerializer(SerializerBase):
@@ -413,38 +555,98 @@ class MsgpackSerializer(SerializerBase):
 
     __type_replacements = {}
 
+    # A packer's internal buffer never shrinks, so a packer that packed a message larger than this
+    # is discarded. That bounds the memory a thread keeps around for its packer to about this size.
+    max_reused_packer_size = 256 * 1024
+
+    def _packers(self):
+        # packers are reused to avoid creating a new one for every message,
+        # but they are not thread safe so every thread gets its own.
+        # They are kept outside of the serializer object itself, so they don't end up in its __dict__.
+        try:
+            return _msgpack_packers.packers
+        except AttributeError:
+            packers = _msgpack_packers.packers = {}
+            return packers
+
+    def _packer(self):
+        packers = self._packers()
+        try:
+            return packers[id(self)]
+        except KeyError:
+            packer = packers[id(self)] = msgpack.Packer(use_bin_type=True, default=self.default)
+            return packer
+
     def dumpsCall(self, obj, method, vargs, kwargs):
-        return msgpack.packb((obj, method, vargs, kwargs), use_bin_type=True, default=self.default)
+        return self.dumps((obj, method, vargs, kwargs))
 
     def dumps(self, data):
-        return msgpack.packb(data, use_bin_type=True, default=self.default)
+        packer = self._packer()
+        try:
+            result = packer.pack(data)
+        except Exception:
+            del self._packers()[id(self)]  # don't keep it with partial data in its buffer
+            raise
+        if len(result) > self.max_reused_packer_size:
+            del self._packers()[id(self)]
+        return result
 
     def loadsCall(self, data):
-        return msgpack.unpackb(self._convertToBytes(data), raw=False, object_hook=self.object_hook)
+        return msgpack.unpackb(data, raw=False, object_hook=self.object_hook)
 
     def loads(self, data):
-        return msgpack.unpackb(self._convertToBytes(data), raw=False, object_hook=self.object_hook, ext_hook=self.ext_hook)
+        return msgpack.unpackb(data, raw=False, object_hook=self.object_hook, ext_hook=self.ext_hook)
+
+    def _complex_to_ext(self, obj):
+        return self.ext_type(0x30, struct.pack("dd", obj.real, obj.imag))
+
+    def _datetime_to_ext(self, obj):
+        if obj.tzinfo:
+            raise errors.SerializeError("msgpack cannot serialize datetime with timezone info")
+        return self.ext_type(0x32, struct.pack("d", obj.timestamp()))
+
+    def _date_to_ext(self, obj):
+        return self.ext_type(0x33, struct.pack("l", obj.toordinal()))
+
+    def _number_to_ext(self, obj):
+        return self.ext_type(0x31, str(obj).encode("ascii"))     # long
+
+    # converters for the most common types that msgpack can't encode itself, by exact type
+    __converters = {
+        set: lambda self, obj: tuple(obj),     # msgpack module can't deal with sets so we make a tuple out of it
+        uuid.UUID: lambda self, obj: _uuid_str(obj),
+        complex: _complex_to_ext,
+        datetime.datetime: _datetime_to_ext,
+        datetime.date: _date_to_ext,
+        decimal.Decimal: lambda self, obj: str(obj),
+        int: _number_to_ext
+    }
 
     def default(self, obj):
         replacer = self.__type_replacements.get(type(obj), None)
         if replacer:
             obj = replacer(obj)
+        return self._convert(obj)
+
+    def _convert(self, obj):
+        converter = self.__converters.get(type(obj))
+        if converter:
+            return converter(self, obj)
+        # subclasses of the types above, and other types
         if isinstance(obj, set):
             return tuple(obj)  # msgpack module can't deal with sets so we make a tuple out of it
         if isinstance(obj, uuid.UUID):
             return str(obj)
         if isinstance(obj, complex):
-            return msgpack.ExtType(0x30, struct.pack("dd", obj.real, obj.imag))
+            return self._complex_to_ext(obj)
         if isinstance(obj, datetime.datetime):
-            if obj.tzinfo:
-                raise errors.SerializeError("msgpack cannot serialize datetime with timezone info")
-            return msgpack.ExtType(0x32, struct.pack("d", obj.timestamp()))
+            return self._datetime_to_ext(obj)
         if isinstance(obj, datetime.date):
-            return msgpack.ExtType(0x33, struct.pack("l", obj.toordinal()))
+            return self._date_to_ext(obj)
         if isinstance(obj, decimal.Decimal):
             return str(obj)
         if isinstance(obj, numbers.Number):
-            return msgpack.ExtType(0x31, str(obj).encode("ascii"))     # long
+            return self._number_to_ext(obj)
         if isinstance(obj, array.array):
             if obj.typecode == 'c':
                 return obj.tostring()
@@ -453,6 +655,10 @@ class MsgpackSerializer(SerializerBase):
             return obj.tolist()
         return self.class_to_dict(obj)
 
+    @staticmethod
+    def ext_type(code, data):
+        return msgpack.ExtType(code, data)
+
     def object_hook(self, obj):
         if "__class__" in obj:
             return self.dict_to_class(obj)
@@ -477,6 +683,71 @@ class MsgpackSerializer(SerializerBase):
         cls.__type_replacements[object_type] = replacement_function
 
 
+class MsgspecSerializer(MsgpackSerializer):
+    """
+    (de)serializer that produces and reads msgpack data using the much faster msgspec library.
+    It is not enabled as the msgpack serializer, you have to select it explicitly (as "msgspec").
+    The msgpack serializer can read its data (they share the serializer id), but the results differ:
+    msgspec encodes datetimes, dates, times, timedeltas, uuids and decimals itself, as strings.
+    It also can't serialize integers that don't fit in 64 bits.
+    """
+    serializer_id = 4  # never change this
+
+    # a registry of its own, replacements registered for msgpack don't apply here and vice versa
+    __type_replacements = {}
+
+    # types that msgspec encodes itself; the default hook (and so type replacements) never sees them
+    native_types = (datetime.datetime, datetime.date, datetime.time, datetime.timedelta,
+                    uuid.UUID, decimal.Decimal, enum.Enum, frozenset)
+
+    def __init__(self):
+        # creating the encoder and decoder is relatively expensive, so reuse them
+        self._encoder = msgspec.msgpack.Encoder(enc_hook=self.default)
+        self._decoder = msgspec.msgpack.Decoder(ext_hook=self.ext_hook)
+
+    def dumpsCall(self, obj, method, vargs, kwargs):
+        return self.dumps((obj, method, vargs, kwargs))
+
+    def dumps(self, data):
+        try:
+            return self._encoder.encode(data)
+        except OverflowError:
+            raise errors.SerializeError("msgspec cannot serialize integers larger than 64 bits")
+        except RecursionError:
+            # mirror the exception type returned by the other serializers
+            raise ValueError("circular reference detected")
+
+    def loadsCall(self, data):
+        obj, method, vargs, kwargs = self._decoder.decode(data)
+        vargs = self.recreate_classes(vargs)
+        kwargs = self.recreate_classes(kwargs)
+        return obj, method, vargs, kwargs
+
+    def loads(self, data):
+        return self.recreate_classes(self._decoder.decode(data))
+
+    def default(self, obj):
+        replacer = self.__type_replacements.get(type(obj), None)
+        if replacer:
+            obj = replacer(obj)
+        return self._convert(obj)
+
+    @staticmethod
+    def ext_type(code, data):
+        return msgspec.msgpack.Ext(code, data)
+
+    def ext_hook(self, code, data):
+        return super(MsgspecSerializer, self).ext_hook(code, bytes(data))
+
+    @classmethod
+    def register_type_replacement(cls, object_type, replacement_function):
+        if inspect.isclass(object_type) and (issubclass(object_type, cls.native_types) or dataclasses.is_dataclass(object_type)):
+            raise ValueError("msgspec serializes this type itself, a replacement for it would be ignored")
+        if object_type is type or not inspect.isclass(object_type):
+            raise ValueError("refusing to register replacement for a non-type or the type 'type' itself")
+        cls.__type_replacements[object_type] = replacement_function
+
+
 """The various serializers that are supported"""
 serializers = {
     "serpent": SerpentSerializer(),
@@ -484,6 +755,10 @@ serializers = {
     "json": JsonSerializer()
 }
 
+# msgspec shares its serializer id with msgpack; it is added first,
+# so that data with that id is read with the msgpack library if it is available
+if msgspec:
+    serializers["msgspec"] = MsgspecSerializer()
 if msgpack:
     serializers["msgpack"] = MsgpackSerializer()
 
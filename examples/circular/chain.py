@@ -3,6 +3,8 @@ from Pyro5.api import expose, Proxy
 
 # a Chain member. Passes messages to the next link,
 # until the message went full-circle: then it exits.
+# The trace of the route is returned in reverse order (every link appends
+# to it, which is cheaper than inserting at the front), the client reverses it.
 
 class Chain(object):
     def __init__(self, name, next_node):
@@ -21,5 +23,5 @@ class Chain(object):
             print("I'm %s, passing to %s" % (self.name, self.nextName))
             message.append(self.name)
             result = self.next.process(message)
-            result.insert(0, "passed on from " + self.name)
+            result.append("passed on from " + self.name)
             return result
@@ -2,4 +2,6 @@ from Pyro5.api import Proxy
 
 
 obj = Proxy("PYRONAME:example.chain.A")
-print("Result=%s" % obj.process(["hello"]))
+result = obj.process(["hello"])
+result.reverse()    # the chain returns the trace in reverse order
+print("Result=%s" % result)
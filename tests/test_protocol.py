@@ -1,3 +1,4 @@
+import os
 import zlib
 import pytest
 import Pyro5.protocol
@@ -39,6 +40,17 @@ class TestSendingMessage:
         finally:
             Pyro5.config.COMPRESSION = compr_orig
 
+    def test_compression_incompressible(self):
+        compr_orig = Pyro5.config.COMPRESSION
+        try:
+            Pyro5.config.COMPRESSION = True
+            payload = os.urandom(1000)
+            msg = Pyro5.protocol.SendingMessage(Pyro5.protocol.MSG_INVOKE, 0, 42, 99, payload)
+            assert not (msg.flags & Pyro5.protocol.FLAGS_COMPRESSED)
+            assert msg.data.endswith(payload)
+        finally:
+            Pyro5.config.COMPRESSION = compr_orig
+
 
 class TestReceivingMessage:
     def createmessage(self, compression=False):
@@ -6,7 +6,12 @@ Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
 import array
 import collections
 import copy
+import datetime
+import decimal
+import enum
+import json
 import math
+import struct
 import uuid
 import pytest
 import Pyro5.errors
@@ -33,6 +38,18 @@ class TestSerpentSerializer:
         d = self.serializer.loads(memoryview(ser))
         assert d == [4, 5, 6]
 
+    def testSourceByteTypesSlice(self):
+        # the data is usually a part of a larger buffer, such as the received message
+        data = ["hello", 1.5, {"key": [1, 2, 3]}, "x" * 1000]
+        call_ser = self.serializer.dumpsCall("object", "method", data, {"kwarg": 42})
+        ser = self.serializer.dumps(data)
+        buffer = bytearray(b"header" + call_ser + b"footer")
+        obj, method, vargs, kwargs = self.serializer.loadsCall(memoryview(buffer)[6:-6])
+        assert (obj, method, list(vargs), kwargs) == ("object", "method", data, {"kwarg": 42})
+        buffer = bytearray(b"header" + ser + b"footer")
+        assert list(self.serializer.loads(memoryview(buffer)[6:-6])) == data
+        assert list(self.serializer.loads(bytearray(ser))) == data
+
     def testSerializePyroTypes(self):
         uri = Pyro5.core.URI("PYRO:obj@host:9999")
         ser = self.serializer.dumps(uri)
@@ -430,7 +447,9 @@ class TestSerializer2_serpent:
         assert e2.custom_attribute == 999
 
     def testSerializeSpecialException(self):
-        assert "GeneratorExit" in Pyro5.serializers.all_exceptions
+        assert Pyro5.serializers._resolve_exception("GeneratorExit") is GeneratorExit
+        assert Pyro5.serializers._resolve_exception("TimeoutError") is Pyro5.errors.TimeoutError
+        assert Pyro5.serializers._resolve_exception("log") is None
         e = GeneratorExit()
         d = self.serializer.dumps(e)
         e2 = self.serializer.loads(d)
@@ -447,6 +466,20 @@ class TestSerializer2_serpent:
         number, uri = self.serializer.recreate_classes([1, {"uri": d}])
         assert number == 1
         assert uri["uri"] == Pyro5.core.URI("PYRO:555@localhost:80")
+        result = self.serializer.recreate_classes((1, [{"a": d}], {"b": (d, 2)}, {3, 4}))
+        assert result == (1, [{"a": uri["uri"]}], {"b": (uri["uri"], 2)}, {3, 4})
+        data = [1, (2, 3), {"a": [4, {5, 6}]}]
+        assert self.serializer.recreate_classes(data) is data
+
+    def testRecreateClassesDeepNesting(self):
+        d = {"__class__": "Pyro5.core.URI", "state": ['PYRO', '555', None, 'localhost', 80]}
+        data = [d]
+        for _ in range(5000):
+            data = [data]
+        result = self.serializer.recreate_classes(data)
+        for _ in range(5000):
+            result = result[0]
+        assert result == [Pyro5.core.URI("PYRO:555@localhost:80")]
 
     def testUriSerializationWithoutSlots(self):
         u = Pyro5.core.URI("PYRO:obj@localhost:1234")
@@ -555,6 +588,83 @@ class TestSerializer2_json(TestSerializer2_serpent):
     def testDeque(self):
         pass    # can't serialize this in json
 
+    def testSpecialNumbers(self):
+        data = [2**70, -2**70, 12345678901234567890, float("inf"), None, {1: 2}]
+        data2 = self.serializer.loads(self.serializer.dumps(data))
+        assert data2[:5] == data[:5]
+        assert data2[5] == {"1": 2}
+        data2 = self.serializer.loads(memoryview(b'[NaN, 123456789012345678901234567890]'))
+        assert math.isnan(data2[0])
+        assert data2[1] == 123456789012345678901234567890
+        data2 = self.serializer.loads(self.serializer.dumps([None, "null", float("nan")]))
+        assert data2[:2] == [None, "null"]
+        assert math.isnan(data2[2])
+        data2 = self.serializer.loads(self.serializer.dumps({"a": None, "b": [1.5, float("-inf")]}))
+        assert data2["a"] is None
+        assert data2["b"][0] == 1.5
+        assert math.isinf(data2["b"][1])
+
+    def testDefaultConverters(self):
+        class SetSub(set):
+            pass
+
+        class UUIDSub(uuid.UUID):
+            pass
+
+        class DateTimeSub(datetime.datetime):
+            pass
+
+        class DateSub(datetime.date):
+            pass
+
+        class DecimalSub(decimal.Decimal):
+            pass
+
+        uuid_obj = uuid.uuid4()
+        assert self.serializer.default({1}) == (1,)
+        assert self.serializer.default(SetSub({1})) == (1,)
+        assert self.serializer.default(uuid_obj) == str(uuid_obj)
+        assert self.serializer.default(UUIDSub(int=uuid_obj.int)) == str(uuid_obj)
+        assert self.serializer.default(datetime.datetime(2020, 1, 2, 3, 4, 5)) == "2020-01-02T03:04:05"
+        assert self.serializer.default(DateTimeSub(2020, 1, 2, 3, 4, 5)) == "2020-01-02T03:04:05"
+        assert self.serializer.default(datetime.date(2020, 1, 2)) == "2020-01-02"
+        assert self.serializer.default(DateSub(2020, 1, 2)) == "2020-01-02"
+        assert self.serializer.default(decimal.Decimal("1.5")) == "1.5"
+        assert self.serializer.default(DecimalSub("1.5")) == "1.5"
+
+    def testSameAsJsonModule(self):
+        class FloatSub(float):
+            pass
+
+        class Color(enum.Enum):
+            RED = 1
+
+        class IntColor(enum.IntEnum):
+            RED = 1
+
+        NT = collections.namedtuple("NT", "a b")
+        uri = Pyro5.core.URI("PYRO:obj@host:4444")
+        for value in [NT(1, 2), FloatSub(1.5), Color.RED, IntColor.RED, {"nt": NT(1, 2)}, uri, {"n": math.inf}, {1: 2}]:
+            for data in ([value], [value, None]):
+                try:
+                    expected = json.loads(json.dumps(data, default=self.serializer.default))
+                except TypeError:
+                    with pytest.raises(TypeError):
+                        self.serializer.dumps(data)
+                else:
+                    assert json.loads(self.serializer.dumps(data)) == expected
+
+    def testTypeReplacementUUID(self):
+        uri = Pyro5.core.URI("PYRO:replaced@localhost:4444")
+        replacements = Pyro5.serializers.JsonSerializer._JsonSerializer__type_replacements
+        try:
+            self.serializer.register_type_replacement(uuid.UUID, lambda obj: uri)
+            data = self.serializer.loads(self.serializer.dumps({"id": uuid.uuid4()}))
+            assert data == {"id": uri}
+        finally:
+            del replacements[uuid.UUID]
+            Pyro5.serializers.JsonSerializer._JsonSerializer__orjson_bypasses_replacement = False
+
 
 class TestSerializer2_marshal(TestSerializer2_serpent):
     SERIALIZER = "marshal"
@@ -589,6 +699,133 @@ if "msgpack" in Pyro5.serializers.serializers:
             assert sorted(data2) == [111, 222, 333]
 
 
+if Pyro5.serializers.msgpack:
+    class TestMsgpackPacker:
+        def testReusedPackerAfterError(self):
+            ser = Pyro5.serializers.MsgpackSerializer()
+            with pytest.raises(Pyro5.errors.SerializeError):
+                ser.dumps([1, 2, 3, object()])
+            assert ser.loads(ser.dumps([1, 2, 3])) == [1, 2, 3]
+            assert ser.loads(ser.dumps("hello")) == "hello"
+
+        def testLargeMessageDiscardsPacker(self):
+            ser = Pyro5.serializers.MsgpackSerializer()
+            ser.dumps("small")
+            packer = ser._packer()
+            ser.dumps("small")
+            assert ser._packer() is packer
+            large = b"x" * (ser.max_reused_packer_size + 1)
+            assert ser.loads(ser.dumps(large)) == large
+            assert id(ser) not in ser._packers()
+            assert ser.loads(ser.dumps("small")) == "small"
+
+        def testPackerNotInInstanceDict(self):
+            ser = Pyro5.serializers.MsgpackSerializer()
+            ser.dumps("small")
+            assert vars(ser) == {}
+            assert ser == Pyro5.serializers.MsgpackSerializer()
+
+
+if Pyro5.serializers.msgpack and Pyro5.serializers.msgspec:
+    class TestMsgspecMsgpackInterop:
+        def testRoundtrip(self):
+            msgspec_ser = Pyro5.serializers.MsgspecSerializer()
+            msgpack_ser = Pyro5.serializers.MsgpackSerializer()
+            data = [42, "hello", b"bytes", 1.5, complex(1, 2), {"key": [1, 2, 3]}, Pyro5.core.URI("PYRO:obj@host:4444")]
+            assert msgpack_ser.loads(msgspec_ser.dumps(data)) == data
+            assert msgspec_ser.loads(msgpack_ser.dumps(data)) == data
+
+        def testCall(self):
+            msgspec_ser = Pyro5.serializers.MsgspecSerializer()
+            msgpack_ser = Pyro5.serializers.MsgpackSerializer()
+            ser = msgspec_ser.dumpsCall("object", "method", ("vargs1", "vargs2"), {"kwargs": 999})
+            obj, method, vargs, kwargs = msgpack_ser.loadsCall(ser)
+            assert obj == "object"
+            assert method == "method"
+            assert vargs == ["vargs1", "vargs2"]
+            assert kwargs == {"kwargs": 999}
+            ser = msgpack_ser.dumpsCall("object", "method", ("vargs1", "vargs2"), {"kwargs": 999})
+            obj, method, vargs, kwargs = msgspec_ser.loadsCall(ser)
+            assert obj == "object"
+            assert method == "method"
+            assert vargs == ["vargs1", "vargs2"]
+            assert kwargs == {"kwargs": 999}
+
+        def testDatetime(self):
+            msgspec_ser = Pyro5.serializers.MsgspecSerializer()
+            msgpack_ser = Pyro5.serializers.MsgpackSerializer()
+            dt = datetime.datetime(2020, 1, 2, 3, 4, 5)
+            date = datetime.date(2020, 1, 2)
+            assert msgpack_ser.loads(msgpack_ser.dumps([dt, date])) == [dt, date]
+            # msgspec encodes these as strings itself
+            assert msgspec_ser.loads(msgspec_ser.dumps([dt, date])) == ["2020-01-02T03:04:05", "2020-01-02"]
+            assert msgpack_ser.loads(msgspec_ser.dumps([dt, date])) == ["2020-01-02T03:04:05", "2020-01-02"]
+            # but it can read the msgpack ext types
+            assert msgspec_ser.loads(msgpack_ser.dumps([dt, date])) == [dt, date]
+
+        def testSeparateTypeReplacements(self):
+            class Replaced:
+                pass
+
+            msgspec_ser = Pyro5.serializers.MsgspecSerializer()
+            msgpack_ser = Pyro5.serializers.MsgpackSerializer()
+            uri = Pyro5.core.URI("PYRO:replaced@localhost:4444")
+            uuid_obj = uuid.uuid4()
+            try:
+                # registered for msgpack: msgspec doesn't use it, and still refuses it for itself
+                Pyro5.serializers.MsgpackSerializer.register_type_replacement(uuid.UUID, lambda obj: uri)
+                assert msgpack_ser.loads(msgpack_ser.dumps([uuid_obj])) == [uri]
+                assert msgspec_ser.loads(msgspec_ser.dumps([uuid_obj])) == [str(uuid_obj)]
+                with pytest.raises(ValueError):
+                    Pyro5.serializers.MsgspecSerializer.register_type_replacement(uuid.UUID, lambda obj: uri)
+                # registered for msgspec: msgpack doesn't use it
+                Pyro5.serializers.MsgspecSerializer.register_type_replacement(Replaced, lambda obj: uri)
+                assert msgspec_ser.loads(msgspec_ser.dumps([Replaced()])) == [uri]
+                assert msgpack_ser.default(Replaced())["__class__"].endswith("Replaced")
+            finally:
+                Pyro5.serializers.MsgpackSerializer._MsgpackSerializer__type_replacements.pop(uuid.UUID, None)
+                Pyro5.serializers.MsgspecSerializer._MsgspecSerializer__type_replacements.pop(Replaced, None)
+
+
+if "msgspec" in Pyro5.serializers.serializers:
+    class TestMsgspecSerializer(TestSerpentSerializer):
+        serializer = Pyro5.serializers.serializers["msgspec"]
+
+    class TestSerializer2_msgspec(TestSerializer2_serpent):
+        SERIALIZER = "msgspec"
+
+        def testDeque(self):
+            pass    # msgspec can't serialize this
+
+        def testSet(self):
+            data = {111, 222, 333}
+            ser = self.serializer.dumps(data)
+            data2 = self.serializer.loads(ser)
+            assert sorted(data2) == [111, 222, 333]
+
+        def testTypeReplacement(self):
+            class Replaced:
+                pass
+
+            uri = Pyro5.core.URI("PYRO:replaced@localhost:4444")
+            self.serializer.register_type_replacement(Replaced, lambda obj: uri)
+            assert self.serializer.loads(self.serializer.dumps([Replaced()])) == [uri]
+            with pytest.raises(ValueError):
+                self.serializer.register_type_replacement(uuid.UUID, lambda obj: uri)
+            with pytest.raises(ValueError):
+                self.serializer.register_type_replacement(datetime.datetime, lambda obj: uri)
+
+        def testBigInt(self):
+            with pytest.raises(Pyro5.errors.SerializeError):
+                self.serializer.dumps([2**70])
+
+    def testMsgspecNotDefault():
+        assert type(Pyro5.serializers.serializers["msgspec"]) is Pyro5.serializers.MsgspecSerializer
+        if Pyro5.serializers.msgpack:
+            assert type(Pyro5.serializers.serializers["msgpack"]) is Pyro5.serializers.MsgpackSerializer
+            assert type(Pyro5.serializers.serializers_by_id[4]) is Pyro5.serializers.MsgpackSerializer
+
+
 class TestGenericCases:
     def testSerializersAvailable(self):
         _ = Pyro5.serializers.serializers["serpent"]
@@ -600,6 +837,7 @@ class TestGenericCases:
         assert Pyro5.serializers.MarshalSerializer.serializer_id == 2
         assert Pyro5.serializers.JsonSerializer.serializer_id == 3
         assert Pyro5.serializers.MsgpackSerializer.serializer_id == 4
+        assert Pyro5.serializers.MsgspecSerializer.serializer_id == 4
 
     def testSerializersAvailableById(self):
         _ = Pyro5.serializers.serializers_by_id[1]  # serpent
@@ -652,6 +890,51 @@ class TestGenericCases:
         assert x == uri
         assert x.sockname == "/tmp/socketname"
 
+    def testClassToDictSlots(self):
+        class Slotted(object):
+            __slots__ = ("a", "b")
+
+            def __init__(self):
+                self.a = 1
+                self.b = "two"
+
+        d = Pyro5.serializers.SerializerBase.class_to_dict(Slotted())
+        assert d["a"] == 1
+        assert d["b"] == "two"
+        assert d["__class__"].endswith(".Slotted")
+
+    def testClassToDictRegisteredViaSubclass(self):
+        o = MyThingPartlyExposed("test")
+        Pyro5.serializers.JsonSerializer.register_class_to_dict(MyThingPartlyExposed, mything_dict)
+        try:
+            assert Pyro5.serializers.SerializerBase.class_to_dict(o)["__class__"] == "CUSTOM-Mythingymabob"
+            assert Pyro5.serializers.MarshalSerializer.class_to_dict(o)["__class__"] == "CUSTOM-Mythingymabob"
+        finally:
+            Pyro5.serializers.MarshalSerializer.unregister_class_to_dict(MyThingPartlyExposed)
+        assert Pyro5.serializers.JsonSerializer.class_to_dict(o).get("__class__") != "CUSTOM-Mythingymabob"
+
+    def testDictClassPyroTypes(self):
+        x = Pyro5.serializers.SerializerBase.dict_to_class({"__class__": "Pyro5.util.JsonSerializer"})
+        assert isinstance(x, Pyro5.serializers.JsonSerializer)
+        x = Pyro5.serializers.SerializerBase.dict_to_class({"__class__": "struct.error", "__exception__": True,
+                                                            "args": ("error",), "attributes": {}})
+        assert isinstance(x, struct.error)
+        d = {"__class__": "Pyro5.core._ExceptionWrapper",
+             "exception": {"__class__": "builtins.ValueError", "__exception__": True, "args": ("error",), "attributes": {}}}
+        x = Pyro5.serializers.SerializerBase.dict_to_class(d)
+        assert isinstance(x, Pyro5.core._ExceptionWrapper)
+        assert isinstance(x.exception, ValueError)
+        with pytest.raises(Pyro5.errors.SecurityError):
+            Pyro5.serializers.SerializerBase.dict_to_class({"__class__": "Pyro5.core.__dict__"})
+
+    def testDictClassBytesClassname(self):
+        d = {"__class__": b"Pyro5.core.URI", "state": ['PYRO', '555', None, 'localhost', 80]}
+        x = Pyro5.serializers.SerializerBase.dict_to_class(d)
+        assert x == Pyro5.core.URI("PYRO:555@localhost:80")
+        d = {"__class__": b"builtins.ValueError", "__exception__": True, "args": ("error",), "attributes": {}}
+        x = Pyro5.serializers.SerializerBase.dict_to_class(d)
+        assert isinstance(x, ValueError)
+
     def testCustomDictClass(self):
         o = MyThingPartlyExposed("test")
         Pyro5.serializers.SerializerBase.register_class_to_dict(MyThingPartlyExposed, mything_dict)
@@ -681,6 +964,16 @@ class TestGenericCases:
         assert repr(exc) == "ZeroDivisionError('hello', 42)"
         assert exc.test_attribute == 99
 
+    def testMakeException(self):
+        data = {"args": ("hello", 42), "attributes": {"test_attribute": 99, "_other": "x"}}
+        exc = Pyro5.serializers.SerializerBase.make_exception(ZeroDivisionError, data)
+        assert isinstance(exc, ZeroDivisionError)
+        assert exc.args == ("hello", 42)
+        assert exc.test_attribute == 99
+        assert exc._other == "x"
+        exc = Pyro5.serializers.SerializerBase.make_exception(ValueError, {"args": ()})
+        assert isinstance(exc, ValueError)
+
     def testExceptionNotTagged(self):
         data = {'__class__': 'builtins.ZeroDivisionError',
                 'args': ('hello', 42),